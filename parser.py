@@ -1,6 +1,71 @@
-import xml.etree.ElementTree as ET
+try:
+    from lxml import etree as ET
+    _HAS_LXML = True
+except ImportError:
+    # lxml is optional; the stdlib parser exposes the same find/findall API
+    import xml.etree.ElementTree as ET
+    _HAS_LXML = False
+import functools
 import re
+import sys
 
+
+_TOP_LEVEL_TAGS = ("worksheet", "dashboard", "datasource")
+
+
+def _iter_elements(twb_path):
+    """
+    Streams the workbook and yields each worksheet, dashboard and datasource
+    element as soon as its closing tag has been parsed.
+    """
+    if _HAS_LXML:
+        context = ET.iterparse(twb_path, events=("end",), tag=_TOP_LEVEL_TAGS,
+                               collect_ids=False)
+        for _, elem in context:
+            yield elem
+    else:
+        for _, elem in ET.iterparse(twb_path, events=("end",)):
+            if elem.tag in _TOP_LEVEL_TAGS:
+                yield elem
+
+
+def _release(elem):
+    """
+    Frees a processed element along with the already processed siblings
+    before it, so the parsed tree does not grow with the workbook.
+    """
+    elem.clear()
+    if _HAS_LXML:
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+
+
+def _xpath(expr):
+    """
+    Compiles an XPath expression once so it can be reused across elements.
+    Without lxml, returns a callable running the equivalent findall.
+    """
+    if _HAS_LXML:
+        return ET.XPath(expr)
+    return lambda elem: elem.findall(expr)
+
+
+_XP_CONN = _xpath(".//connection")
+_XP_METADATA_COLS = _xpath(".//metadata-records/metadata-record[@class='column']")
+_XP_COLS = _xpath(".//column")
+
+# A bracketed field part with optional derivation prefix and type suffix,
+# e.g. [none:FieldName:nk] or [FieldName]. Names may contain '[' and the
+# escaped ']]' Tableau writes for ']', e.g. [sum:Sales [USD]]:qk]
+_FIELD_PART_RE = re.compile(r"\[(?:[^:\[\]]*:)?((?:[^:\[\]]|\]\]|\[)+?)(?::[^\[\]]*)?\](?!\])")
+
+# Usage roles, shared by every usage_map entry
+_ROW = sys.intern("Row")
+_COLUMN = sys.intern("Column")
+_FILTER = sys.intern("Filter")
+
+
+@functools.lru_cache(maxsize=8192)
 def normalize_field_ref(field_ref):
     """
     Normalizes a Tableau field reference string by stripping out derivation
@@ -9,26 +74,243 @@ def normalize_field_ref(field_ref):
     """
     if not field_ref:
         return field_ref
-        
-    parts = field_ref.split('].[')
-    normalized_parts = []
-    
-    for part in parts:
-        clean_part = part.strip('[]')
-        
-        # Check if the part has derivation tags (contains ':')
-        if ':' in clean_part:
-            # Format is usually [derivation:name:type]
-            # We want the middle part
-            sub_parts = clean_part.split(':')
-            if len(sub_parts) >= 2:
-                # If it's [none:Field:nk] or [sum:Field:qk]
-                # The field name is index 1
-                clean_part = sub_parts[1]
-        
-        normalized_parts.append(f"[{clean_part}]")
-        
-    return ".".join(normalized_parts)
+
+    # Each bracketed part is usually [derivation:name:type]; keep only the name.
+    # Shelf expressions can leave a trailing space after the last part.
+    return _FIELD_PART_RE.sub(r"[\1]", field_ref.rstrip())
+
+
+class Field:
+    """
+    A data source field along with the worksheets that use it. Used while
+    parsing only; parse_twb returns fields as plain dicts.
+    """
+    __slots__ = ("tech_name", "name", "role", "datatype", "formula", "usage")
+
+    def __init__(self, tech_name, name, role="", datatype="", formula="", usage=""):
+        self.tech_name = tech_name
+        self.name = name
+        self.role = role
+        self.datatype = datatype
+        self.formula = formula
+        self.usage = usage
+
+    def to_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+class Datasource:
+    """
+    A data source with its connections, custom SQL queries and fields. Used
+    while parsing only; parse_twb returns data sources as plain dicts.
+    """
+    __slots__ = ("name", "tech_name", "connections", "queries", "fields")
+
+    def __init__(self, name, tech_name):
+        self.name = name
+        self.tech_name = tech_name
+        self.connections = []
+        self.queries = []
+        self.fields = []
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "tech_name": self.tech_name,
+            "connections": self.connections,
+            "queries": self.queries,
+            "fields": [field.to_dict() for field in self.fields]
+        }
+
+
+def _split_field_ref(field_ref):
+    """
+    Splits a normalized field reference into its datasource name and field
+    (e.g., [federated.abc].[Sales] -> ('federated.abc', '[Sales]')).
+    Unprefixed references get an empty datasource name.
+    """
+    if field_ref.startswith('['):
+        ds_name, sep, field_name = field_ref[1:].partition('].')
+        if sep:
+            return ds_name, field_name
+    return "", field_ref
+
+
+def _map_worksheet_usage(ws, ws_name, usage_map):
+    """
+    Records which fields a worksheet places on rows, columns and filters.
+    usage_map is keyed by datasource name, then field, then worksheet name.
+    """
+    def record(field, role):
+        ds_name, field_name = _split_field_ref(normalize_field_ref(field))
+        usage_map.setdefault(ds_name, {}).setdefault(field_name, {}).setdefault(ws_name, set()).add(role)
+
+    # Roles we track: Rows, Columns, Filters
+    # One walk over the worksheet collects every shelf instead of a search per tag
+    rows = None
+    cols = None # Note: XML uses <column> tag inside <table> for columns
+
+    for node in ws.iter():
+        tag = node.tag
+        if tag == 'rows':
+            if rows is None:
+                rows = node
+        elif tag == 'column':
+            if cols is None:
+                cols = node
+        elif tag == 'filter':
+            col_name = node.get('column')
+            if col_name:
+                record(col_name, _FILTER)
+        elif tag == 'slices':
+            for slice_node in node:
+                if slice_node.tag == 'column' and slice_node.text:
+                    record(slice_node.text, _FILTER)
+
+    if rows is not None and rows.text:
+        for field in rows.text.split('/'):
+            field = field.strip('()')
+            if field:
+                record(field, _ROW)
+
+    if cols is not None and cols.text:
+        for field in cols.text.split('/'):
+            field = field.strip('()')
+            if field:
+                record(field, _COLUMN)
+
+
+def _process_datasource(ds, usage_map):
+    """
+    Extracts connections, custom SQL and fields from a datasource element.
+    Returns a (parameters, Datasource or None) pair; the Parameters datasource
+    only contributes parameter names.
+    """
+    caption = ds.get('caption') or ds.get('name')
+
+    # Parameters Handling
+    if caption == 'Parameters' or (ds.get('name') and ds.get('name').startswith('Parameters')):
+        parameters = []
+        for col in _XP_COLS(ds):
+            p_name = col.get('caption') or col.get('name')
+            if p_name:
+                parameters.append(p_name.strip('[]'))
+        return parameters, None
+
+    if not caption:
+        return [], None
+
+    ds_info = Datasource(caption, ds.get('name'))
+
+    # Connections
+    for conn in _XP_CONN(ds):
+        get = conn.get
+        conn_class = get('class')
+        if conn_class and conn_class != 'federated':
+            ds_info.connections.append({
+                "class": sys.intern(conn_class),
+                "server": get('server'),
+                "dbname": get('dbname')
+            })
+
+    # Custom SQL
+    found_queries = []
+    seen_queries = set()
+    # Note: User explicitly changed .false to .true here to see metadata relations
+    # Checking the tag first skips most nodes before any attribute lookup
+    for rel in ds.iter('*'):
+        tag = rel.tag
+        if 'relation' not in tag:
+            continue
+        if rel.get('type') != 'text':
+            continue
+        if 'ObjectModelEncapsulateLegacy' in tag and '.true' not in tag:
+            continue
+
+        sql = rel.text
+        if sql and sql.strip():
+            query_text = sql.strip()
+            if query_text not in seen_queries:
+                seen_queries.add(query_text)
+                found_queries.append(query_text)
+
+    ds_info.queries = found_queries
+
+    # Field Discovery from Metadata Records
+    # dictionary keyed by tech_name (local-name)
+    fields_by_tech = {}
+
+    for mr in _XP_METADATA_COLS(ds):
+        findtext = mr.findtext
+        local_name = findtext('local-name')
+        if not local_name: continue
+        remote_name = findtext('remote-name')
+        local_type = findtext('local-type')
+
+        fields_by_tech[local_name] = Field(
+            local_name,
+            remote_name or local_name.strip('[]'),
+            datatype=sys.intern(local_type) if local_type else ""
+        )
+
+    # Field Enrichment from Column tags (UI captures, Roles, Calcs)
+    for col in _XP_COLS(ds):
+        get = col.get
+        name_attr = get('name')
+        if not name_attr: continue
+        caption = get('caption')
+        role = get('role')
+        datatype = get('datatype')
+
+        field_obj = fields_by_tech.get(name_attr)
+        # If we don't have it from metadata, it might be a calculated field or UI parameter
+        if field_obj is None:
+            field_obj = fields_by_tech[name_attr] = Field(name_attr, name_attr.strip('[]'))
+
+        # Prefer caption if exists
+        if caption:
+            field_obj.name = caption
+
+        # Fill in Role/DataType if missing or if column tag provides specialized role
+        if role:
+            field_obj.role = sys.intern(role.capitalize())
+        if datatype:
+            field_obj.datatype = sys.intern(datatype.capitalize())
+
+        # Check for calculation
+        calc = col.find("calculation")
+        if calc is not None:
+            field_obj.formula = calc.get('formula') or ""
+            field_obj.role = "Calculation"
+
+    # Finalize Usage Mapping and Build Field List
+    ds_tech_prefix = ds_info.tech_name if ds_info.tech_name else ""
+    ds_usage = usage_map.get(ds_tech_prefix, {})
+    # References without a datasource prefix may point at any datasource
+    loose_usage = usage_map.get("") if ds_tech_prefix else None
+
+    for tech_name, field_obj in fields_by_tech.items():
+        # Usage Info
+        usage_info = ds_usage.get(tech_name)
+        if loose_usage and tech_name in loose_usage:
+            merged = {ws_name: set(roles) for ws_name, roles in loose_usage[tech_name].items()}
+            for ws_name, roles in (usage_info or {}).items():
+                merged.setdefault(ws_name, set()).update(roles)
+            usage_info = merged
+
+        usage_str_parts = []
+        for ws_name, roles in (usage_info or {}).items():
+            role_str = "/".join(sorted(roles))
+            usage_str_parts.append(f"{ws_name} ({role_str})")
+
+        field_obj.usage = ", ".join(usage_str_parts) if usage_str_parts else "Not Used"
+
+        # Add to ds_info list
+        ds_info.fields.append(field_obj)
+
+    if ds_info.connections or ds_info.queries or ds_info.fields:
+        return [], ds_info
+    return [], None
 
 
 def parse_twb(twb_path):
@@ -36,193 +318,57 @@ def parse_twb(twb_path):
     Parses the .twb XML file to extract data sources, sheets, dashboards, parameters,
     and field usage tracking.
     """
+    # Field references rarely repeat across workbooks, so don't carry them over
+    normalize_field_ref.cache_clear()
+
+    data = {
+        "datasources": [],
+        "worksheets": [],
+        "dashboards": [],
+        "parameters": []
+    }
+
+    usage_map = {}
+    # Datasources are held back until every worksheet has filled usage_map
+    datasources = []
+
+    # Only parsing is guarded here; anything else raised while reading the
+    # workbook is a bug and should surface with its traceback
     try:
-        tree = ET.parse(twb_path)
-        root = tree.getroot()
-        
-        data = {
-            "datasources": [],
-            "worksheets": [],
-            "dashboards": [],
-            "parameters": []
-        }
+        for elem in _iter_elements(twb_path):
+            tag = elem.tag
 
-        # 1. Map Field Usage in Worksheets
-        usage_map = {}
-
-        for ws in root.findall(".//worksheet"):
-            ws_name = ws.get('name')
-            if not ws_name: continue
-            
-            data["worksheets"].append(ws_name)
-            
-            # Roles we track: Rows, Columns, Filters
-            rows = ws.find(".//rows")
-            cols = ws.find(".//column") # Note: XML uses <column> tag inside <table> for columns
-            
-            if rows is not None and rows.text:
-                for field in rows.text.split('/'):
-                    field = field.strip('()')
-                    if field:
-                        norm_field = normalize_field_ref(field)
-                        usage_map.setdefault(norm_field, {}).setdefault(ws_name, []).append("Row")
-            
-            if cols is not None and cols.text:
-                for field in cols.text.split('/'):
-                    field = field.strip('()')
-                    if field:
-                        norm_field = normalize_field_ref(field)
-                        usage_map.setdefault(norm_field, {}).setdefault(ws_name, []).append("Column")
-
-            # Filters and Slices
-            for filter_node in ws.findall(".//filter"):
-                col_name = filter_node.get('column')
-                if col_name:
-                    norm_field = normalize_field_ref(col_name)
-                    usage_map.setdefault(norm_field, {}).setdefault(ws_name, []).append("Filter")
-            
-            for slice_node in ws.findall(".//slices/column"):
-                if slice_node.text:
-                    norm_field = normalize_field_ref(slice_node.text)
-                    usage_map.setdefault(norm_field, {}).setdefault(ws_name, []).append("Filter")
-
-        # 2. Extract Dashboards
-        for db in root.findall(".//dashboard"):
-            name = db.get('name')
-            if name:
-                data["dashboards"].append(name)
-
-        # 3. Extract Data Sources and Parameters
-        for ds in root.findall(".//datasource"):
-            caption = ds.get('caption') or ds.get('name')
-            
-            # Parameters Handling
-            if caption == 'Parameters' or (ds.get('name') and ds.get('name').startswith('Parameters')):
-                for col in ds.findall(".//column"):
-                    p_name = col.get('caption') or col.get('name')
-                    if p_name:
-                        data["parameters"].append(p_name.strip('[]'))
+            if tag == 'datasource':
+                # Skip datasources with nothing to extract (e.g., the references
+                # held by worksheets and dashboards)
+                if elem.find('.//connection') is not None or elem.find('.//column') is not None:
+                    datasources.append(elem)
                 continue
 
-            if not caption:
-                continue
-            
-            ds_info = {
-                "name": caption, 
-                "tech_name": ds.get('name'), 
-                "connections": [], 
-                "queries": [], 
-                "fields": []
-            }
-            
-            # Connections
-            for conn in ds.findall(".//connection"):
-                conn_class = conn.get('class')
-                if conn_class and conn_class != 'federated':
-                    ds_info["connections"].append({
-                        "class": conn_class,
-                        "server": conn.get('server'),
-                        "dbname": conn.get('dbname')
-                    })
-
-            # Custom SQL
-            found_queries = []
-            # Note: User explicitly changed .false to .true here to see metadata relations
-            for rel in ds.findall(".//*[@type='text']"):
-                tag = rel.tag
-                if 'ObjectModelEncapsulateLegacy' in tag:
-                    if '.true' not in tag:
-                        continue
-                
-                if rel.tag.endswith('relation') or 'relation' in rel.tag:
-                    sql = rel.text
-                    if sql and sql.strip():
-                        query_text = sql.strip()
-                        if query_text not in found_queries:
-                            found_queries.append(query_text)
-            
-            ds_info["queries"] = found_queries
-            
-            # Field Discovery from Metadata Records
-            # dictionary keyed by tech_name (local-name)
-            fields_by_tech = {}
-            
-            for mr in ds.findall(".//metadata-records/metadata-record[@class='column']"):
-                local_name = mr.findtext('local-name')
-                if not local_name: continue
-                
-                fields_by_tech[local_name] = {
-                    "tech_name": local_name,
-                    "name": mr.findtext('remote-name') or local_name.strip('[]'),
-                    "role": "",
-                    "datatype": mr.findtext('local-type') or "",
-                    "formula": "",
-                    "usage": ""
-                }
-
-            # Field Enrichment from Column tags (UI captures, Roles, Calcs)
-            for col in ds.findall(".//column"):
-                name_attr = col.get('name')
-                if not name_attr: continue
-                
-                # If we don't have it from metadata, it might be a calculated field or UI parameter
-                if name_attr not in fields_by_tech:
-                    fields_by_tech[name_attr] = {
-                        "tech_name": name_attr,
-                        "name": col.get('caption') or name_attr.strip('[]'),
-                        "role": "",
-                        "datatype": "",
-                        "formula": "",
-                        "usage": ""
-                    }
-                
-                field_obj = fields_by_tech[name_attr]
-                
-                # Prefer caption if exists
-                if col.get('caption'):
-                    field_obj["name"] = col.get('caption')
-                
-                # Fill in Role/DataType if missing or if column tag provides specialized role
-                if col.get('role'):
-                    field_obj["role"] = col.get('role').capitalize()
-                if col.get('datatype'):
-                    field_obj["datatype"] = col.get('datatype').capitalize()
-                
-                # Check for calculation
-                calc = col.find("calculation")
-                if calc is not None:
-                    field_obj["formula"] = calc.get('formula') or ""
-                    field_obj["role"] = "Calculation"
-
-            # Finalize Usage Mapping and Build Field List
-            ds_tech_prefix = ds_info["tech_name"] if ds_info["tech_name"] else ""
-            
-            for tech_name, field_obj in fields_by_tech.items():
-                # Usage Info
-                tech_names_to_check = [tech_name]
-                if ds_tech_prefix and not tech_name.startswith(f"[{ds_tech_prefix}]"):
-                    tech_names_to_check.append(f"[{ds_tech_prefix}].{tech_name}")
-
-                usage_info = {}
-                for tn in tech_names_to_check:
-                    if tn in usage_map:
-                        for ws_name, roles in usage_map[tn].items():
-                            usage_info.setdefault(ws_name, set()).update(roles)
-
-                usage_str_parts = []
-                for ws_name, roles in usage_info.items():
-                    role_str = "/".join(sorted(list(roles)))
-                    usage_str_parts.append(f"{ws_name} ({role_str})")
-                
-                field_obj["usage"] = ", ".join(usage_str_parts) if usage_str_parts else "Not Used"
-                
-                # Add to ds_info list
-                ds_info["fields"].append(field_obj)
-            
-            if ds_info["connections"] or ds_info["queries"] or ds_info["fields"]:
-                data["datasources"].append(ds_info)
-        #print(data)
-        return data
-    except Exception as e:
+            # 1. Map Field Usage in Worksheets
+            if tag == 'worksheet':
+                ws_name = elem.get('name')
+                if ws_name:
+                    data["worksheets"].append(ws_name)
+                    _map_worksheet_usage(elem, ws_name, usage_map)
+
+            # 2. Extract Dashboards
+            elif tag == 'dashboard':
+                name = elem.get('name')
+                if name:
+                    data["dashboards"].append(name)
+
+            _release(elem)
+    except (ET.ParseError, OSError) as e:
+        # Parse errors carry the line and column of the malformed XML
         print(f"Error parsing .twb file '{twb_path}': {e}")
         return None
+
+    # 3. Extract Data Sources and Parameters
+    for ds in datasources:
+        parameters, ds_info = _process_datasource(ds, usage_map)
+        data["parameters"].extend(parameters)
+        if ds_info is not None:
+            data["datasources"].append(ds_info.to_dict())
+    #print(data)
+    return data
@@ -0,0 +1,146 @@
+import json
+import os
+import sys
+import zipfile
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from parser import normalize_field_ref, parse_twb
+
+
+def legacy_normalize_field_ref(field_ref):
+    """
+    The split/strip/join implementation normalize_field_ref replaced, kept
+    here to pin the regex version against it.
+    """
+    if not field_ref:
+        return field_ref
+
+    parts = field_ref.split('].[')
+    normalized_parts = []
+
+    for part in parts:
+        clean_part = part.strip('[]')
+        if ':' in clean_part:
+            sub_parts = clean_part.split(':')
+            if len(sub_parts) >= 2:
+                clean_part = sub_parts[1]
+        normalized_parts.append(f"[{clean_part}]")
+
+    return ".".join(normalized_parts)
+
+
+@pytest.mark.parametrize("field_ref, expected", [
+    # Unprefixed, without and with derivation/type tags
+    ("[Sales]", "[Sales]"),
+    ("[none:Region:nk]", "[Region]"),
+    ("[usr:Calculation_1:ok]", "[Calculation_1]"),
+    # Prefixed, without and with derivation/type tags
+    ("[federated.abc].[Sales]", "[federated.abc].[Sales]"),
+    ("[federated.abc].[sum:Sales Amount:qk]", "[federated.abc].[Sales Amount]"),
+    ("[federated.abc].[my:Month End:ok]", "[federated.abc].[Month End]"),
+    # Colon edge cases the old code handled by taking the second segment
+    ("[a:b]", "[b]"),
+    ("[x:y:z:w]", "[y]"),
+    ("[:Field]", "[Field]"),
+    # Trailing space left behind by shelf expressions
+    ("[federated.abc].[none:Region:nk] ", "[federated.abc].[Region]"),
+    # Tableau escapes ']' inside a name as ']]'
+    ("[sum:Sales [USD]]:qk]", "[Sales [USD]]]"),
+    ("[ds].[none:Sales [USD]]:nk]", "[ds].[Sales [USD]]]"),
+    ("", ""),
+    (None, None),
+])
+def test_matches_legacy_implementation(field_ref, expected):
+    assert normalize_field_ref(field_ref) == expected
+    assert legacy_normalize_field_ref(field_ref) == expected
+
+
+@pytest.mark.parametrize("field_ref, expected, legacy", [
+    # An escaped ']]' in an underived name is kept whole instead of truncated
+    ("[Sales [USD]]]", "[Sales [USD]]]", "[Sales [USD]"),
+    ("[ds].[Sales [USD]]]", "[ds].[Sales [USD]]]", "[ds].[Sales [USD]"),
+    # Text outside brackets is no longer wrapped in brackets
+    ("A", "A", "[A]"),
+    # A space after the last part is dropped instead of ending up inside it
+    ("[ds].[A] ", "[ds].[A]", "[ds].[A] ]"),
+    # A trailing colon no longer empties the name
+    ("[Field:]", "[Field]", "[]"),
+    # Leading junk stays outside the brackets rather than inside them
+    (" [ds].[none:X:nk]", " [ds].[X]", "[ [ds].[X]"),
+])
+def test_differs_from_legacy_implementation(field_ref, expected, legacy):
+    assert normalize_field_ref(field_ref) == expected
+    assert legacy_normalize_field_ref(field_ref) == legacy
+
+
+def test_parse_twb_returns_plain_data(tmp_path):
+    twbx = os.path.join(REPO_ROOT, "workbooks", "Intercompany Errors.twbx")
+    with zipfile.ZipFile(twbx) as archive:
+        twb_name = next(name for name in archive.namelist() if name.endswith('.twb'))
+        twb_path = archive.extract(twb_name, tmp_path)
+
+    data = parse_twb(twb_path)
+
+    json.dumps(data)
+    ds = data["datasources"][0]
+    assert ds["name"] == "Custom SQL Query (CDW)"
+    assert ds["connections"][0]["class"] == "sqlserver"
+    assert {field["tech_name"] for field in ds["fields"]} >= {"[Company]", "[GLCredit]"}
+
+
+USAGE_TWB = """<?xml version='1.0' encoding='utf-8' ?>
+<workbook>
+  <datasources>
+    <datasource caption='Orders' name='federated.a'>
+      <connection class='sqlserver' server='srv' dbname='orders' />
+      <column name='[Region]' datatype='string' role='dimension' />
+      <column name='[Profit]' datatype='real' role='measure' />
+    </datasource>
+    <datasource caption='Returns' name='federated.b'>
+      <connection class='sqlserver' server='srv' dbname='returns' />
+      <column name='[Region]' datatype='string' role='dimension' />
+      <column name='[Profit]' datatype='real' role='measure' />
+    </datasource>
+  </datasources>
+  <worksheets>
+    <worksheet name='Sheet 1'>
+      <table>
+        <rows>[federated.a].[none:Region:nk]/[federated.a].[none:Region:nk]</rows>
+      </table>
+    </worksheet>
+    <worksheet name='Sheet 2'>
+      <table>
+        <view>
+          <filter class='categorical' column='[Profit]' />
+        </view>
+        <rows>[federated.a].[sum:Profit:qk]</rows>
+      </table>
+    </worksheet>
+  </worksheets>
+</workbook>
+"""
+
+
+def test_parse_twb_attributes_usage_per_datasource(tmp_path):
+    twb_path = tmp_path / "usage.twb"
+    twb_path.write_text(USAGE_TWB, encoding="utf-8")
+
+    data = parse_twb(str(twb_path))
+
+    usage = {
+        (ds["name"], field["tech_name"]): field["usage"]
+        for ds in data["datasources"]
+        for field in ds["fields"]
+    }
+    # A role repeated on one shelf is reported once, and a prefixed reference
+    # does not leak to a same-named field in another datasource
+    assert usage[("Orders", "[Region]")] == "Sheet 1 (Row)"
+    assert usage[("Returns", "[Region]")] == "Not Used"
+    # Unprefixed references apply to every datasource with that field and
+    # merge with prefixed ones on the same worksheet
+    assert usage[("Orders", "[Profit]")] == "Sheet 2 (Filter/Row)"
+    assert usage[("Returns", "[Profit]")] == "Sheet 2 (Filter)"